@@ -13,24 +13,22 @@ else:
     kw = {'entry_points':
           """[console_scripts]\ntarsnapper = tarsnapper.script:run\n""",
           'zip_safe': False}
+import ast
 import re
 
 here = os.path.dirname(os.path.abspath(__file__))
 
 # Figure out the version
 version_re = re.compile(
-    r'__version__ = (\(.*?\))')
+    r'__version__\s*=\s*(\(.*?\))')
 fp = open(os.path.join(here, 'tarsnapper/__init__.py'))
-version = None
-for line in fp:
-    match = version_re.search(line)
-    if match:
-        exec("version = %s" % match.group(1))
-        version = ".".join(map(str, version))
-        break
-else:
+try:
+    match = version_re.search(fp.read())
+finally:
+    fp.close()
+if not match:
     raise Exception("Cannot find version in __init__.py")
-fp.close()
+version = ".".join(map(str, ast.literal_eval(match.group(1))))
 
 setup(name='tarsnapper',
       version=version,
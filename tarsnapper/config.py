@@ -41,11 +41,10 @@ file looks like this:
 from __future__ import print_function
 
 from datetime import timedelta
+import fnmatch
 import glob
-from string import Template
 import os
-
-import yaml
+import re
 
 
 __all__ = ('Job', 'load_config', 'load_config_from_file', 'ConfigError',)
@@ -58,6 +57,9 @@ class ConfigError(Exception):
 class Job(object):
     """Represent a single backup job."""
 
+    __slots__ = ('name', 'aliases', 'target', 'dateformat', 'deltas',
+                 'sources', 'excludes', 'force', 'exec_before', 'exec_after')
+
     def __init__(self, **initial):
         self.name = initial.get('name')
         self.aliases = initial.get('aliases')
@@ -71,6 +73,55 @@ class Job(object):
         self.exec_after = initial.get('exec_after')
 
 
+# Options that can be given in either singular or plural form, but not
+# both at the same time.
+JOB_OPTION_PAIRS = (
+    ('source', 'sources'),
+    ('alias', 'aliases'),
+    ('exclude', 'excludes'),
+    ('delta', 'deltas'),
+)
+
+# All options a job may define.
+JOB_OPTIONS = frozenset(
+    [option for pair in JOB_OPTION_PAIRS for option in pair] +
+    ['target', 'force', 'dateformat', 'exec_before', 'exec_after'])
+
+
+def load_yaml(stream):
+    """Parse ``stream`` (a string or file object) as YAML.
+
+    PyYAML is only imported here, so that code paths which never read a
+    config file (``--help``, command line jobs) don't pay for loading it.
+    The libyaml-backed loader is used if PyYAML was built with it.
+    """
+    import yaml
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    return yaml.load(stream, Loader=loader)
+
+
+_placeholder_regexes = {}
+
+
+def has_placeholder(text, var):
+    """Return whether ``text`` uses ``$var`` or ``${var}`` in the
+    ``string.Template`` sense.
+
+    ``$$`` is an escaped dollar sign, and ``$variable`` does not count as
+    a use of ``$var``.
+    """
+    try:
+        regex = _placeholder_regexes[var]
+    except KeyError:
+        regex = _placeholder_regexes[var] = re.compile(
+            r'\$(?:\$|(%s)(?![_a-zA-Z0-9])|\{(%s)\})' % (
+                re.escape(var), re.escape(var)))
+    for match in regex.finditer(text):
+        if match.group(1) or match.group(2):
+            return True
+    return False
+
+
 def require_placeholders(text, placeholders, what):
     """
     Ensure that ``text`` contains the given placeholders.
@@ -80,43 +131,54 @@ def require_placeholders(text, placeholders, what):
     """
     if text is not None:
         for var in placeholders:
-            if Template(text).safe_substitute({var: 'foo'}) == text:
+            if not has_placeholder(text, var):
                 raise ConfigError(('%s must make use of the following '
                                    'placeholders: %s') % (
                                        what, ", ".join(placeholders)))
     return text
 
 
+# Seconds per unit, by delta suffix.
+_DELTA_UNITS = {'s': 1, 'h': 3600, 'd': 86400}
+
+
+_parsed_deltas = {}
+
+
 def str_to_timedelta(text):
-    """Parse a string to a timedelta value."""
-    if text.endswith('s'):
-        return timedelta(seconds=int(text[:-1]))
-    elif text.endswith('h'):
-        return timedelta(seconds=int(text[:-1]) * 3600)
-    elif text.endswith('d'):
-        return timedelta(days=int(text[:-1]))
-    raise ValueError(text)
+    """Parse a string to a timedelta value.
+
+    Results are cached, since the same few deltas tend to be repeated
+    across jobs.
+    """
+    try:
+        return _parsed_deltas[text]
+    except KeyError:
+        pass
+    multiplier = _DELTA_UNITS.get(text[-1:])
+    if multiplier is None:
+        raise ValueError(text)
+    delta = _parsed_deltas[text] = timedelta(seconds=int(text[:-1]) * multiplier)
+    return delta
 
 
 def parse_deltas(delta_string):
-    """Parse the given string into a list of ``timedelta`` instances."""
+    """Parse the given string into a tuple of ``timedelta`` instances.
+
+    The result is immutable so that it can be shared between jobs.
+    """
     if delta_string is None:
         return None
 
-    deltas = []
-    for item in delta_string.split(' '):
-        item = item.strip()
-        if not item:
-            continue
-        try:
-            deltas.append(str_to_timedelta(item))
-        except ValueError as e:
-            raise ConfigError('Not a valid delta: %s' % e)
+    try:
+        deltas = [str_to_timedelta(item) for item in delta_string.split()]
+    except ValueError as e:
+        raise ConfigError('Not a valid delta: %s' % e)
 
     if deltas and len(deltas) < 2:
         raise ConfigError('At least two deltas are required')
 
-    return deltas
+    return tuple(deltas)
 
 
 def parse_named_deltas(named_delta_dict):
@@ -128,11 +190,39 @@ def parse_named_deltas(named_delta_dict):
     return named_deltas
 
 
+def find_job_files(pattern):
+    """Return the sorted list of files matching the include-jobs glob
+    ``pattern``.
+
+    In the common case of wildcards only in the last path component,
+    like ``directory/*.yml``, the directory is read with a single
+    ``os.scandir``, whose entries usually know whether they are files
+    without another ``stat`` call. Otherwise, fall back to ``glob``.
+    """
+    directory, basename = os.path.split(pattern)
+    if (hasattr(os, 'scandir') and glob.has_magic(basename)
+            and not glob.has_magic(directory)):
+        try:
+            entries = list(os.scandir(directory or os.curdir))
+        except OSError:
+            return []
+        # Like glob, only match hidden files if the pattern asks for them
+        include_hidden = basename.startswith('.')
+        entries = dict((entry.name, entry) for entry in entries
+                       if include_hidden or not entry.name.startswith('.'))
+        files = [os.path.join(directory, name)
+                 for name in fnmatch.filter(entries, basename)
+                 if entries[name].is_file()]
+    else:
+        files = filter(os.path.isfile, glob.iglob(pattern))
+    return sorted(files)
+
+
 def load_config(text):
     """Load the config file and return a dict of jobs, with the local
     and global configurations merged.
     """
-    config = yaml.safe_load(text)
+    config = load_yaml(text)
 
     default_dateformat = config.pop('dateformat', None)
     default_deltas = parse_deltas(config.pop('deltas', None))
@@ -142,83 +232,77 @@ def load_config(text):
     named_deltas = parse_named_deltas(config.pop('delta-names', {}))
     include_jobs_dir = config.pop('include-jobs', None)
 
-    read_jobs = {}
     jobs_section = config.pop('jobs', None)
 
     def load_job(job_name, job_dict):
         """Construct a valid Job from the given job configuration yaml and return it.
         """
         job_dict = job_dict or {}
+        unsupported = [key for key in job_dict if key not in JOB_OPTIONS]
+        if unsupported:
+            raise ConfigError('%s has unsupported configuration values: %s' % (
+                job_name, ", ".join(unsupported)))
+        for single, plural in JOB_OPTION_PAIRS:
+            if single in job_dict and plural in job_dict:
+                raise ConfigError(('%s: Use either the "%s" or "%s" ' +
+                                   'option, not both') % (
+                                       job_name, single, plural))
+
+        get = job_dict.get
         # sources
-        if 'sources' in job_dict and 'source' in job_dict:
-            raise ConfigError(('%s: Use either the "source" or "sources" ' +
-                               'option, not both') % job_name)
         if 'source' in job_dict:
-            sources = [job_dict.pop('source')]
+            sources = [job_dict['source']]
         else:
-            sources = job_dict.pop('sources', None)
+            sources = get('sources')
         # aliases
-        if 'aliases' in job_dict and 'alias' in job_dict:
-            raise ConfigError(('%s: Use either the "alias" or "aliases" ' +
-                               'option, not both') % job_name)
         if 'alias' in job_dict:
-            aliases = [job_dict.pop('alias')]
+            aliases = [job_dict['alias']]
         else:
-            aliases = job_dict.pop('aliases', None)
+            aliases = get('aliases')
         # excludes
-        if 'excludes' in job_dict and 'exclude' in job_dict:
-            raise ConfigError(('%s: Use either the "excludes" or "exclude" ' +
-                               'option, not both') % job_name)
         if 'exclude' in job_dict:
-            excludes = [job_dict.pop('exclude')]
+            excludes = [job_dict['exclude']]
         else:
-            excludes = job_dict.pop('excludes', [])
+            excludes = get('excludes', [])
         # deltas
-        if 'deltas' in job_dict and 'delta' in job_dict:
-            raise ConfigError(('%s: Use either the "deltas" or "delta" ' +
-                               'option, not both') % job_name)
         if 'delta' in job_dict:
-            delta_name = job_dict.pop('delta', None)
+            delta_name = job_dict['delta']
             if delta_name not in named_deltas:
                 raise ConfigError(('%s: Named delta "%s" not defined')
                                   % (job_name, delta_name))
-            deltas = list(named_deltas[delta_name])
+            deltas = named_deltas[delta_name]
         else:
-            deltas = parse_deltas(job_dict.pop('deltas', None))
-            if deltas is None and default_deltas is not None:
-                deltas = list(default_deltas)
+            deltas = parse_deltas(get('deltas'))
+            if deltas is None:
+                deltas = default_deltas
         new_job = Job(**{
             'name': job_name,
             'sources': sources,
             'aliases': aliases,
             'excludes': excludes,
-            'target': job_dict.pop('target', default_target),
-            'force': job_dict.pop('force', False),
+            'target': get('target', default_target),
+            'force': get('force', False),
             'deltas': deltas,
-            'dateformat': job_dict.pop('dateformat', default_dateformat),
-            'exec_before': job_dict.pop('exec_before', None),
-            'exec_after': job_dict.pop('exec_after', None),
+            'dateformat': get('dateformat', default_dateformat),
+            'exec_before': get('exec_before'),
+            'exec_after': get('exec_after'),
         })
         if not new_job.target:
             raise ConfigError('%s does not have a target name' % job_name)
         # Note: It's ok to define jobs without sources or deltas. Those
         # can only be used for selected commands, then.
-        require_placeholders(new_job.target, ['date'], '%s: target')
-        if job_dict:
-            raise ConfigError('%s has unsupported configuration values: %s' % (
-                job_name, ", ".join(job_dict.keys())))
+        require_placeholders(new_job.target, ['date'], '%s: target' % job_name)
         return new_job
 
-    if jobs_section:
-        for job_name, job_dict in jobs_section.items():
-            if job_name in read_jobs:
-                raise ConfigError('%s: duplicated job name' % job_name)
-            read_jobs[job_name] = load_job(job_name, job_dict)
+    # Names within the jobs section are mapping keys, so they can't clash
+    # with each other; only included job files need checking.
+    read_jobs = {job_name: load_job(job_name, job_dict)
+                 for job_name, job_dict in (jobs_section or {}).items()}
 
     if include_jobs_dir:
-        for jobs_file in sorted(filter(os.path.isfile, glob.iglob(include_jobs_dir))):
-            with open(jobs_file) as f:
-                jobs_file_yaml = yaml.safe_load(f)
+        for jobs_file in find_job_files(include_jobs_dir):
+            with open(jobs_file, 'rb') as f:
+                jobs_file_yaml = load_yaml(f)
             for job_name, job_dict in jobs_file_yaml.items():
                 if job_name in read_jobs:
                     raise ConfigError('%s: duplicated job name' % job_name)
@@ -234,6 +318,6 @@ def load_config(text):
 def load_config_from_file(filename):
     f = open(filename, 'rb')
     try:
-        return load_config(f.read())
+        return load_config(f)
     finally:
         f.close()
@@ -1,17 +1,10 @@
+from bisect import bisect_left
 import operator
 
 
 __all__ = ('expire',)
 
 
-def timedelta_div(td1, td2):
-    """http://stackoverflow.com/questions/865618/how-can-i-perform-divison-on-a-datetime-timedelta-in-python
-    """
-    us1 = td1.microseconds + 1000000 * (td1.seconds + 86400 * td1.days)
-    us2 = td2.microseconds + 1000000 * (td2.seconds + 86400 * td2.days)
-    return float(us1) / us2
-
-
 def expire(backups, deltas):
     """Given a dict of backup name => backup timestamp pairs in
     ``backups``, and a list of ``timedelta`` objects in ``deltas`` defining
@@ -46,21 +39,33 @@ def expire(backups, deltas):
     if not backups:
         return []
 
-    # First, sort the backups with most recent one first
-    backups = sorted(backups.items(), key=lambda x: x[1], reverse=True)
-    old_backups = backups[:]
+    # First, sort the backups by date, oldest first. For backups that
+    # share a date, the order they were given in is preserved, and the
+    # first one of such a group is the one that will be picked.
+    backups = sorted(backups.items(), key=operator.itemgetter(1))
+    dates = [bd for bn, bd in backups]
 
-    # Also make sure that we have the deltas in ascending order
-    deltas.sort()
+    def closest(dt):
+        """Return the backup closest to ``dt``; on a tie, the newer one."""
+        i = bisect_left(dates, dt)
+        if i == len(dates) or (
+                i > 0 and dt - dates[i - 1] < dates[i] - dt):
+            i = bisect_left(dates, dates[i - 1])
+        return backups[i]
+
+    # Also make sure that we have the deltas in ascending order. This
+    # makes a copy, the caller's list is left alone.
+    deltas = sorted(deltas)
 
     # Always keep the most recent backup
-    most_recent_backup = backups[0][1]
-    to_keep = set([backups[0][0]])
+    most_recent_backup = dates[-1]
+    to_keep = set([closest(most_recent_backup)[0]])
 
-    # Then, for each delta/generation, determine which backup to keep
-    last_delta = deltas.pop()
-    while deltas:
-        current_delta = deltas.pop()
+    # Then, for each delta/generation, starting with the largest,
+    # determine which backup to keep
+    for i in range(len(deltas) - 1, 0, -1):
+        last_delta = deltas[i]
+        current_delta = deltas[i - 1]
 
         # (1) Start from the point in time where the current generation ends.
         dt_pointer = most_recent_backup - last_delta
@@ -72,25 +77,19 @@ def expire(backups, deltas):
             # in general. We do the latter. The difference is merely in how
             # long the oldest backup in each generation should be kept, that
             # is, how the given deltas should be interpreted.
-            by_dist = sorted([(bn, bd, abs(bd - dt_pointer)) for bn, bd in backups], key=operator.itemgetter(2))
-            if by_dist:
-                if by_dist[0][0] == last_selected:
-                    # If the time diff between two backups is larger than
-                    # the delta, it can happen that multiple iterations of
-                    # this loop determine the same backup to be closest.
-                    # In this case, to avoid looping endlessly, we need to
-                    # force the date pointer to move forward.
-                    dt_pointer += current_delta
-                else:
-                    last_selected = by_dist[0][0]
-                    to_keep.add(by_dist[0][0])
-                    # (3) Proceed forward in time, jumping by the current
-                    # generation's delta.
-                    dt_pointer = by_dist[0][1] + current_delta
+            name, date = closest(dt_pointer)
+            if name == last_selected:
+                # If the time diff between two backups is larger than
+                # the delta, it can happen that multiple iterations of
+                # this loop determine the same backup to be closest.
+                # In this case, to avoid looping endlessly, we need to
+                # force the date pointer to move forward.
+                dt_pointer += current_delta
             else:
-                # No more backups found in this generation.
-                break
-
-        last_delta = current_delta
+                last_selected = name
+                to_keep.add(name)
+                # (3) Proceed forward in time, jumping by the current
+                # generation's delta.
+                dt_pointer = date + current_delta
 
     return list(to_keep)
@@ -1,25 +1,28 @@
 from __future__ import print_function
 
 import argparse
+from bisect import bisect_left, insort
 from datetime import datetime
 import getpass
-from io import StringIO
 import logging
 import os
-from os import path
 from string import Template
-import subprocess
 import re
+import stat
 import sys
+import tempfile
 import uuid
 
-import dateutil.parser
 import pexpect
 
 from . import config, expire
 from .config import Job
 
 
+# tarsnap asks for this on the terminal when the keyfile is encrypted.
+_PASSPHRASE_PROMPT = re.compile(u'Please enter passphrase for keyfile .*?:')
+
+
 class ArgumentError(Exception):
     pass
 
@@ -36,6 +39,10 @@ class TarsnapBackend(object):
     to mimimize the calls to "tarsnap --list-archives" by caching the result.
     """
 
+    # Beyond this many archives, names are passed to tarsnap in a file
+    # rather than as command line arguments.
+    max_archive_args = 500
+
     def __init__(self, log, options, dryrun=False):
         """
         ``options`` - options to pass to each tarsnap call
@@ -51,6 +58,7 @@ class TarsnapBackend(object):
         self.dryrun = dryrun
         self._queried_archives = None
         self._known_archives = []
+        self._sorted_archives = None
         self.key_passphrase = None
 
     def call(self, *arguments):
@@ -68,7 +76,8 @@ class TarsnapBackend(object):
         return self._exec_tarsnap(call_with)
 
     def _exec_tarsnap(self, args):
-        self.log.debug("Executing: %s", " ".join(args))
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("Executing: %s", " ".join(args))
         env = os.environ
         child = pexpect.spawn(args[0], args[1:], env=env, timeout=None,
                               encoding='utf-8', codec_errors='ignore')
@@ -77,7 +86,7 @@ class TarsnapBackend(object):
             child.logfile = sys.stdout
 
         # look for the passphrase prompt
-        has_prompt = (child.expect([u'Please enter passphrase for keyfile .*?:', pexpect.EOF]) == 0)
+        has_prompt = (child.expect([_PASSPHRASE_PROMPT, pexpect.EOF]) == 0)
         if has_prompt:
             child.sendline(self._get_key_passphrase())
             child.expect(pexpect.EOF)
@@ -96,6 +105,7 @@ class TarsnapBackend(object):
 
     def _exec_util(self, cmdline, shell=False):
         # TODO: can this be merged with _exec_tarsnap into something generic?
+        import subprocess
         self.log.debug("Executing: %s", cmdline)
         p = subprocess.Popen(cmdline, shell=True)
         p.communicate()
@@ -111,62 +121,84 @@ class TarsnapBackend(object):
         to requery the server.
         """
         self._known_archives.append(name)
+        if self._sorted_archives is not None:
+            insort(self._sorted_archives, name)
+
+    def _remove_archives(self, names):
+        """Drop deleted archives from the cached list of archives."""
+        names = set(names)
+        self._queried_archives = [
+            a for a in self._queried_archives if a not in names]
+        self._known_archives = [
+            a for a in self._known_archives if a not in names]
+        if self._sorted_archives is not None:
+            self._sorted_archives = [
+                a for a in self._sorted_archives if a not in names]
 
     def get_archives(self):
         """A list of archives as returned by --list-archives. Queried
         the first time it is accessed, and then subsequently cached.
         """
         if self._queried_archives is None:
-            response = StringIO(self.call('--list-archives'))
-            self._queried_archives = [l.rstrip() for l in response.readlines()]
+            lines = self.call('--list-archives').splitlines()
             if ['v'] in self.options:
                 # Filter out extraneous info if tarsnap was run with
                 # verbose flag
-                self._queried_archives = [
-                    l.rsplit('\t', 1)[0] for l in self._queried_archives]
+                lines = (l.rsplit('\t', 1)[0] for l in lines)
+            self._queried_archives = list(lines)
         return self._queried_archives + self._known_archives
     archives = property(get_archives)
 
+    def get_sorted_archives(self):
+        """The list of archives, sorted, so that all archives starting
+        with a given prefix can be found quickly. Built once, and then
+        kept up to date as archives are made or deleted.
+        """
+        if self._sorted_archives is None:
+            self._sorted_archives = sorted(self.get_archives())
+        return self._sorted_archives
+
     def get_backups(self, job):
         """Return a dict of backups that exist for the given job, by
         parsing the list of archives.
         """
-        # Assemble regular expressions that match the job's target
-        # filenames, including those based on it's aliases.
-        unique = uuid.uuid4().hex
-        regexes = []
-        for possible_name in [job.name] + (job.aliases or []):
-            target = Template(job.target).substitute(
-                {'name': possible_name, 'date': unique})
-            regexes.append(re.compile("^%s$" %
-                           re.escape(target).replace(unique, '(?P<date>.*?)')))
+        # Get the matchers for the job's target filenames, including
+        # those based on it's aliases.
+        matchers = [target_matcher(job.target, possible_name)
+                    for possible_name in [job.name] + (job.aliases or [])]
+        is_date = date_matcher(job.dateformat) if job.dateformat else None
 
+        archives = self.get_sorted_archives()
         backups = {}
-        for backup_path in self.get_archives():
-            match = None
-            for regex in regexes:
-                match = regex.match(backup_path)
-                if match:
-                    break
-            else:
-                # Not one of the regexes matched.
-                continue
-            try:
-                date = parse_date(match.groupdict()['date'], job.dateformat)
-            except ValueError as e:
-                # This can occasionally happen when multiple archives
-                # share a prefix, say for example you have "windows-$date"
-                # and "windows-data-$date". Since we have to use a generic
-                # .* regex to capture the date part, when processing the
-                # "windows-$date" targets, we'll stumble over entries where
-                # we try to parse "data-$date" as a date. Make sure we
-                # only print a warning, rather than crashing.
-                # TODO: It'd take some work, but we could build a proper
-                # regex based on any given date format string, thus avoiding
-                # the issue for most cases.
-                self.log.exception("Ignoring '%s': %s", backup_path, e)
-            else:
-                backups[backup_path] = date
+        matched = set()
+        for matcher in matchers:
+            # Since the archives are sorted, those starting with the
+            # target's fixed prefix are all next to each other.
+            i = bisect_left(archives, matcher.prefix)
+            while i < len(archives) and archives[i].startswith(matcher.prefix):
+                backup_path = archives[i]
+                i += 1
+                if backup_path in matched:
+                    # Already taken by a previous name or alias.
+                    continue
+                date_str = matcher(backup_path)
+                if date_str is None:
+                    continue
+                matched.add(backup_path)
+                if is_date is not None and not is_date(date_str):
+                    # Say you have "windows-$date" and "windows-data-$date";
+                    # when processing the former, "data-$date" can't be a
+                    # date, so don't even try to parse it.
+                    continue
+                try:
+                    date = parse_date(date_str, job.dateformat)
+                except ValueError as e:
+                    # The same prefix clash as above, for jobs without a
+                    # dateformat or with one date_matcher can't check.
+                    # Make sure we only print a warning, not crash.
+                    self.log.exception("Ignoring '%s': %s", backup_path, e)
+                else:
+                    backups[backup_path] = date
 
         return backups
 
@@ -183,39 +215,44 @@ class TarsnapBackend(object):
 
         # Determine which backups we need to get rid of, which to keep
         to_keep = expire.expire(backups, job.deltas)
-        self.log.info('%d of those can be deleted', (len(backups)-len(to_keep)))
+        num_delete = len(backups) - len(to_keep)
+        self.log.info('%d of those can be deleted', num_delete)
 
-        # Delete all others
-        to_delete = []
-        for name in backups.keys():
-            if name not in to_keep:
-                to_delete.append(name)
-
-        to_keep.sort()
-        to_delete.sort()
-
-        self.log.debug('Keeping %s', ' '.join(to_keep))
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug('Keeping %s', ' '.join(sorted(to_keep)))
 
-        if len(to_delete) == 0:
+        if num_delete == 0:
             return
 
-        self.log.info('Deleting %s', ' '.join(to_delete))
+        # Delete all others, oldest first: archives close in time tend to
+        # share most of their data, which tarsnap can then reuse.
+        to_delete = sorted(set(backups).difference(to_keep),
+                           key=lambda name: (backups[name], name))
+
+        if self.log.isEnabledFor(logging.INFO):
+            self.log.info('Deleting %s', ' '.join(to_delete))
 
         if not self.dryrun:
-            # group into batches of up to 500 files in a single delete call for
-            # improved efficiency: https://www.tarsnap.com/improve-speed.html#faster-delete
-            # 500 is a somewhat arbitrary batch size. The actual restriction is
-            # typically a bytes limit on the size of the command that the shell
-            # will accept, which can vary widely across OS flavors. Because
-            # it's a bytes limit, this is also dependent on the length of the
-            # backup filenames. So rather than deal with all this complexity,
-            # 500 was chosen as a reasonable balance between safety and speed.
-            batch_size = 500
-            for i in range(0, len(to_delete), batch_size):
-                batch = to_delete[i:i + batch_size]
-                self.call('-d', '-f', *' -f '.join(batch).split(' '))
-                for name in batch:
-                    self.archives.remove(name)
+            # Delete everything in a single call for improved efficiency:
+            # https://www.tarsnap.com/improve-speed.html#faster-delete
+            # Up to a point, the names are passed as -f arguments. The
+            # actual restriction is a bytes limit on the size of the
+            # command line, which varies across OS flavors and depends on
+            # the length of the names, so past a somewhat arbitrary count
+            # we rather hand them to tarsnap in a file via --archive-names.
+            if len(to_delete) <= self.max_archive_args:
+                args = ['-d']
+                for name in to_delete:
+                    args.extend(['-f', name])
+                self.call(*args)
+            else:
+                with tempfile.NamedTemporaryFile(
+                        prefix='tarsnapper-', suffix='.txt') as f:
+                    for name in to_delete:
+                        f.write((name + '\n').encode('utf-8'))
+                    f.flush()
+                    self.call('-d', '--archive-names', f.name)
+            self._remove_archives(to_delete)
 
     def make(self, job):
         now = datetime.utcnow()
@@ -244,14 +281,143 @@ class TarsnapBackend(object):
 DEFAULT_DATEFORMAT = '%Y%m%d-%H%M%S'
 
 
+_target_matchers = {}
+
+
+def target_matcher(target, name):
+    """Return a function that, given an archive name, returns the date
+    part of it if the name is one the ``target`` template yields for the
+    job ``name``, or ``None`` otherwise. The fixed part of such names
+    before the date is available as the function's ``prefix`` attribute.
+
+    The date is the only variable part of such names, so this is a
+    matter of checking a fixed prefix and suffix. Matchers are cached,
+    since they are needed for every command that looks at a job's
+    existing archives.
+    """
+    key = (target, name)
+    try:
+        return _target_matchers[key]
+    except KeyError:
+        pass
+    unique = uuid.uuid4().hex
+    target = Template(target).substitute({'name': name, 'date': unique})
+    prefix, _, suffix = target.partition(unique)
+    start, end = len(prefix), -len(suffix) or None
+    min_length = len(prefix) + len(suffix)
+
+    def matcher(archive):
+        if (len(archive) >= min_length and archive.startswith(prefix)
+                and archive.endswith(suffix)):
+            return archive[start:end]
+        return None
+    matcher.prefix = prefix
+
+    _target_matchers[key] = matcher
+    return matcher
+
+
+# Regular expressions accepting at least everything ``strptime`` accepts
+# for the numeric format directives.
+_DIRECTIVE_PATTERNS = {
+    'Y': r'\d{4}', 'G': r'\d{4}', 'y': r'\d{2}',
+    'm': r'\d{1,2}', 'd': r' ?\d{1,2}', 'H': r'\d{1,2}', 'I': r'\d{1,2}',
+    'M': r'\d{1,2}', 'S': r'\d{1,2}', 'U': r'\d{1,2}', 'W': r'\d{1,2}',
+    'V': r'\d{1,2}', 'j': r'\d{1,3}', 'f': r'\d{1,6}', 'w': r'\d',
+    'u': r'\d', '%': '%',
+}
+_format_token = re.compile(r'%(.)|(\s+)|(.)', re.DOTALL)
+_date_matchers = {}
+
+
+def date_matcher(dateformat):
+    """Return a function telling whether a string may be a date in the
+    ``strptime`` format ``dateformat``, or ``None`` if the format uses
+    directives (like month names) that are not supported here.
+
+    This allows skipping archive names that merely share the fixed parts
+    of a job's target, without having ``strptime`` fail on each of them.
+    """
+    if dateformat in _date_matchers:
+        return _date_matchers[dateformat]
+    pattern = []
+    for match in _format_token.finditer(dateformat):
+        directive, whitespace, literal = match.groups()
+        if directive is not None:
+            if directive not in _DIRECTIVE_PATTERNS:
+                pattern = None
+                break
+            pattern.append(_DIRECTIVE_PATTERNS[directive])
+        elif whitespace is not None:
+            # strptime lets any run of whitespace match
+            pattern.append(r'\s+')
+        else:
+            pattern.append(re.escape(literal))
+    if pattern is None:
+        matcher = None
+    else:
+        # Like strptime, match literals regardless of case
+        regex = re.compile(r'(?:%s)\Z' % ''.join(pattern), re.IGNORECASE)
+        def matcher(string):
+            return regex.match(string) is not None
+    _date_matchers[dateformat] = matcher
+    return matcher
+
+
+# Common date shapes that can be parsed with strptime rather than
+# python-dateutil when no format is given, with the same result.
+_KNOWN_DATE_SHAPES = (
+    (re.compile(r'[0-9]{8}-[0-9]{6}\Z'), DEFAULT_DATEFORMAT),
+    (re.compile(r'[0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}\Z'),
+     '%Y-%m-%dT%H:%M:%S'),
+    (re.compile(r'[0-9]{4}-[0-9]{2}-[0-9]{2}\Z'), '%Y-%m-%d'),
+)
+
+_parsed_dates = {}
+
+
 def parse_date(string, dateformat=None):
     """Parse a date string, either using the given format, or by
     relying on python-dateutil.
+
+    Results are cached, since the same archive names are parsed once
+    for every job (and alias) they might belong to.
     """
+    key = (string, dateformat)
+    try:
+        return _parsed_dates[key]
+    except KeyError:
+        pass
     if dateformat:
-        return datetime.strptime(string, dateformat)
+        date = datetime.strptime(string, dateformat)
     else:
-        return dateutil.parser.parse(string)
+        date = None
+        for shape, shape_format in _KNOWN_DATE_SHAPES:
+            if shape.match(string):
+                try:
+                    date = datetime.strptime(string, shape_format)
+                except ValueError:
+                    pass
+                break
+        if date is None:
+            import dateutil.parser
+            date = dateutil.parser.parse(string)
+    _parsed_dates[key] = date
+    return date
+
+
+def is_empty_dir(directory):
+    """Return whether ``directory`` has no entries, without listing all
+    of them where ``os.scandir`` is available.
+    """
+    if not hasattr(os, 'scandir'):
+        return not os.listdir(directory)
+    entries = os.scandir(directory)
+    try:
+        return next(entries, None) is None
+    finally:
+        if hasattr(entries, 'close'):
+            entries.close()
 
 
 def timedelta_string(value):
@@ -367,11 +533,12 @@ class MakeCommand(ExpireCommand):
         sources_missing = False
         if not job.force:
             for source in job.sources:
-                if not path.exists(source):
+                try:
+                    mode = os.stat(source).st_mode
+                except OSError:
                     sources_missing = True
                     break
-                if path.isdir(source) and not os.listdir(source):
-                    # directory is empty
+                if stat.S_ISDIR(mode) and is_empty_dir(source):
                     sources_missing = True
                     break
 
@@ -532,11 +699,12 @@ def main(argv):
 
     # Validate the requested list of jobs to run
     if args.jobs:
-        unknown = set(args.jobs) - set(jobs.keys())
+        requested = set(args.jobs)
+        unknown = requested - set(jobs.keys())
         if unknown:
             log.error('Error: not defined in the config file: %s', ", ".join(unknown))
             return 1
-        jobs_to_run = dict([(n, j) for n, j in jobs.items() if n in args.jobs])
+        jobs_to_run = {n: j for n, j in jobs.items() if n in requested}
     else:
         jobs_to_run = jobs
 
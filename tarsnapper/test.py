@@ -1,9 +1,5 @@
+from collections import OrderedDict
 from datetime import datetime
-try:
-    from collections import OrderedDict    # Python 2.7
-except ImportError:
-    # Install from: http://pypi.python.org/pypi/ordereddict
-    from ordereddict import OrderedDict
 
 from .config import parse_deltas
 from .expire import expire as default_expire_func
@@ -45,9 +41,7 @@ class BackupSimulator(object):
 
     def expire(self):
         keep = self.expire_func(self.backups, self.deltas)
-        deleted = []
-        for key in self.backups.keys():
-            if not key in keep:
-                deleted.append(key)
-                del self.backups[key]
+        deleted = [key for key in self.backups if key not in keep]
+        for key in deleted:
+            del self.backups[key]
         return deleted, keep
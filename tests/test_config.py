@@ -1,3 +1,8 @@
+import os
+from os import path
+import shutil
+import tempfile
+
 from nose.tools import assert_raises
 
 from tarsnapper.config import load_config, ConfigError
@@ -139,6 +144,21 @@ def test_target_has_date():
         sources: /etc
         deltas: 1d 2d
     """)
+    # An escaped dollar sign is not a placeholder
+    assert_raises(ConfigError, load_config, """
+    jobs:
+      foo:
+        target: $name-$$date
+        sources: /etc
+        deltas: 1d 2d
+    """)
+    load_config("""
+    jobs:
+      foo:
+        target: $name-${date}
+        sources: /etc
+        deltas: 1d 2d
+    """)
 
 
 def test_dateformat_inheritance():
@@ -278,3 +298,33 @@ def test_named_delta_and_deltas():
         delta: myDelta
         deltas: 5d 10d
     """)
+
+
+def test_include_jobs():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for filename, job in (('a.yml', 'a'), ('b.yml', 'b'),
+                              ('.hidden.yml', 'hidden'), ('c.txt', 'c')):
+            with open(path.join(tmpdir, filename), 'w') as f:
+                f.write('%s:\n  target: %s-$date\n' % (job, job))
+        os.mkdir(path.join(tmpdir, 'dir.yml'))
+
+        jobs, _ = load_config("""
+        include-jobs: %s
+        """ % path.join(tmpdir, '*.yml'))
+        assert sorted(jobs) == ['a', 'b']
+
+        jobs, _ = load_config("""
+        include-jobs: %s
+        """ % path.join(tmpdir, '[ac].*'))
+        assert sorted(jobs) == ['a', 'c']
+
+        # Included jobs may not redefine existing ones
+        assert_raises(ConfigError, load_config, """
+        include-jobs: %s
+        jobs:
+          a:
+            target: a-$date
+        """ % path.join(tmpdir, '*.yml'))
+    finally:
+        shutil.rmtree(tmpdir)
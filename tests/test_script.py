@@ -1,6 +1,7 @@
 import argparse
 from datetime import datetime
 import logging
+import os
 from os import path
 import re
 import shutil
@@ -9,7 +10,7 @@ import tempfile
 from tarsnapper.config import Job, parse_deltas, str_to_timedelta
 from tarsnapper.script import (
     TarsnapBackend, MakeCommand, ListCommand, ExpireCommand, parse_args,
-    DEFAULT_DATEFORMAT)
+    date_matcher, DEFAULT_DATEFORMAT)
 
 
 class FakeBackend(TarsnapBackend):
@@ -21,6 +22,9 @@ class FakeBackend(TarsnapBackend):
 
     def _exec_tarsnap(self, args):
         self.calls.append(args[1:])  # 0 is "tarsnap"
+        if '--archive-names' in args:
+            with open(args[args.index('--archive-names') + 1]) as f:
+                self.archive_names = f.read().splitlines()
         if '--list-archives' in args:
             return u"\n".join(self.fake_archives)
 
@@ -46,16 +50,21 @@ class FakeBackend(TarsnapBackend):
 
 class BaseTest(object):
 
-    def setup(self):
-        self.log = logging.getLogger("test_script")
-        self._tmpdir = tempfile.mkdtemp()
+    @classmethod
+    def setup_class(cls):
+        # The source directory is shared by all tests of a class.
+        cls._tmpdir = tempfile.mkdtemp()
         # We need at least a file for tarsnapper to consider a source
         # to "exist".
-        open(path.join(self._tmpdir, '.placeholder'), 'w').close()
-        self.now = datetime.utcnow()
+        open(path.join(cls._tmpdir, '.placeholder'), 'w').close()
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls._tmpdir)
 
-    def teardown(self):
-        shutil.rmtree(self._tmpdir)
+    def setup(self):
+        self.log = logging.getLogger("test_script")
+        self.now = datetime.utcnow()
 
     def run(self, jobs, archives, **args):
         final_args = {
@@ -130,6 +139,23 @@ class TestMake(BaseTest):
         cmd = self.run(self.job(sources=None), [])
         assert cmd.backend.match([])
 
+    def test_empty_source(self):
+        """If a source directory is empty, the job is skipped."""
+        empty = tempfile.mkdtemp()
+        try:
+            cmd = self.run(self.job(sources=[self._tmpdir, empty]), [])
+        finally:
+            os.rmdir(empty)
+        assert cmd.backend.match([])
+
+    def test_made_archives_indexed(self):
+        """Archives made by later jobs are added to the sorted listing."""
+        cmd = self.run([self.job(name='b'), self.job(name='a')],
+                       [self.filename('1d', name='c')])
+        archives = cmd.backend.get_sorted_archives()
+        assert len(archives) == 3
+        assert archives == sorted(cmd.backend.archives)
+
     def test_excludes(self):
         cmd = self.run(self.job(excludes=['foo']), [])
         assert cmd.backend.match([
@@ -186,6 +212,53 @@ class TestExpire(BaseTest):
             ('-d', '-f', 'test-.*'),
         ])
 
+    def test_deleted_archives_forgotten(self):
+        """Deleted archives no longer show up in the cached listing."""
+        archives = [self.filename('1d'), self.filename('5d')]
+        cmd = self.run(self.job(deltas='1d 2d'), archives)
+        assert cmd.backend.archives == [self.filename('1d')]
+        assert cmd.backend.get_sorted_archives() == [self.filename('1d')]
+
+    def test_delete_in_one_call(self):
+        """All expired archives are deleted with a single tarsnap call,
+        even if their names contain spaces.
+        """
+        cmd = self.run(self.job(deltas='1d 2d', name='my job'), [
+            self.filename('1d', name='my job'),
+            self.filename('5d', name='my job'),
+            self.filename('6d', name='my job'),
+        ])
+        assert cmd.backend.match([
+            ('--list-archives',),
+            ('-d', '-f', 'my job-.*', '-f', 'my job-.*'),
+        ])
+
+    def test_delete_many(self):
+        """Past a certain number of archives, the names to delete are
+        passed to tarsnap in a file.
+        """
+        archives = [self.filename('%dh' % h) for h in range(1, 30 * 24)]
+        cmd = self.run(self.job(deltas='1d 2d'), archives)
+        assert cmd.backend.match([
+            ('--list-archives',),
+            ('-d', '--archive-names', '.*'),
+        ])
+        assert len(cmd.backend.archive_names) > cmd.backend.max_archive_args
+        assert set(cmd.backend.archive_names) < set(archives)
+
+    def test_delete_oldest_first(self):
+        """Archives are deleted in chronological order, not by name."""
+        cmd = self.run(self.job(deltas='1d 2d', aliases=['alias']), [
+            self.filename('1h'),
+            self.filename('4d', name='alias'),
+            self.filename('5d', name='alias'),
+            self.filename('6d'),
+        ])
+        assert cmd.backend.match([
+            ('--list-archives',),
+            ('-d', '-f', 'test-.*', '-f', 'alias-.*'),
+        ])
+
     def test_aliases(self):
         cmd = self.run(self.job(deltas='1d 2d', aliases=['alias']), [
             self.filename('1d'),
@@ -222,3 +295,12 @@ class TestList(BaseTest):
         assert cmd.backend.match([
             ('--list-archives',)
         ])
+
+
+def test_date_matcher():
+    is_date = date_matcher(DEFAULT_DATEFORMAT)
+    assert is_date('20100615-000000')
+    assert not is_date('dev-20100615-000000')
+    assert not is_date('20100615-000000-dev')
+    # Formats with names in them are not checked up front
+    assert date_matcher('%d %b %Y') is None